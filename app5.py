@@ -1,8 +1,11 @@
 import streamlit as st
-import yfinance as yf
+import altair as alt
 import pandas as pd
-import numpy as np
 import datetime
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from etf_core import calculate_projection, get_historical_metrics, price_paths
 
 # --- 頁面設定 ---
 st.set_page_config(page_title="ETF資產試算", page_icon="📈", layout="wide")
@@ -37,144 +40,79 @@ with st.sidebar:
     
     btn_calc = st.button("開始詳細分析", type="primary")
 
-# --- 函數：抓取歷史數據 ---
-def get_historical_metrics(ticker_symbol):
-    try:
-        stock = yf.Ticker(ticker_symbol)
-        hist = stock.history(period="max", auto_adjust=False)
-        divs = stock.dividends
-        
-        if hist.empty:
-            return None, f"找不到 {ticker_symbol} 的資料"
-            
-        start_price = hist['Close'].iloc[0]
-        end_price = hist['Close'].iloc[-1]
-        
-        time_diff = (hist.index[-1] - hist.index[0]).days
-        years_past = time_diff / 365.25
-        
-        if years_past < 0.01: years_past = 0.01
-            
-        if start_price > 0:
-            price_cagr = (end_price / start_price) ** (1 / years_past) - 1
-        else:
-            price_cagr = 0
-            
-        if not divs.empty:
-            divs.index = divs.index.tz_localize(None)
-            hist.index = hist.index.tz_localize(None)
-            yearly_divs = divs.resample('YE').sum()
-            yearly_prices = hist['Close'].resample('YE').mean()
-            common = yearly_divs.index.intersection(yearly_prices.index)
-            if len(common) > 0:
-                avg_yield = (yearly_divs[common] / yearly_prices[common]).mean()
-            else:
-                avg_yield = divs.sum() / hist['Close'].mean() * (1/years_past)
-        else:
-            avg_yield = 0.0
-            
-        return {
-            "symbol": ticker_symbol,
-            "cagr": price_cagr,
-            "yield": avg_yield,
-            "current_price": end_price,
-            "years_data": years_past
-        }, None
-    except Exception as e:
-        return None, str(e)
+# --- 函數：報表轉 CSV (相同內容的報表直接重用已編碼的位元組) ---
+@st.cache_data(ttl=3600, max_entries=20, show_spinner=False)
+def to_csv_bytes(df):
+    return df.to_csv(index=False).encode('utf-8-sig')
 
-# --- 函數：推算未來資產 (新增：將參數寫入 DataFrame) ---
-def calculate_projection(metrics, initial_fund, monthly_amt, years, is_reinvest):
-    months = years * 12
-    monthly_growth = (1 + metrics['cagr']) ** (1/12) - 1
-    monthly_yield = metrics['yield'] / 12
-    
-    data = []
+# --- 函數：下載區塊 (fragment：按下載只重跑這一塊，不重新抓資料與推算) ---
+@st.fragment
+def download_section(df1, df2, ticker1, ticker2):
+    # 調整欄位順序 (讓重點欄位排前面)
+    cols_order = [
+        "標的代號", "歷史年化報酬率(%)", "歷史平均殖利率(%)", 
+        "第N年", "第N個月", "總投入成本", "總資產市值", 
+        "損益金額", "累積持有股數", "平均成本(均價)", "累積領取股息"
+    ]
     
-    current_price = metrics['current_price']
-    total_shares = 0.0
+    # 下載區塊 A
+    csv1 = to_csv_bytes(df1[cols_order])
+    col_dl1, col_dl2 = st.columns(2)
+    with col_dl1:
+        st.download_button(
+            label=f"下載 {ticker1} 完整報表",
+            data=csv1,
+            file_name=f"{ticker1}_report.csv",
+            mime='text/csv',
+        )
     
-    # 處理第一筆單筆投入
-    if initial_fund > 0:
-        total_shares = initial_fund / current_price
-        
-    total_cost = initial_fund
-    cash_wallet = 0.0
-    total_divs = 0.0
-    
-    for m in range(1, months + 1):
-        # 計算目前是第幾年 (1~12月=1, 13~24月=2...)
-        current_year_num = (m - 1) // 12 + 1
-        
-        # 1. 股價成長
-        current_price = current_price * (1 + monthly_growth)
-        
-        # 2. 定期定額買入
-        if monthly_amt > 0:
-            new_shares = monthly_amt / current_price
-            total_shares += new_shares
-            total_cost += monthly_amt
-            
-        # 3. 處理配息
-        market_val = total_shares * current_price
-        div_amt = market_val * monthly_yield
-        total_divs += div_amt 
-        
-        if is_reinvest:
-            shares_from_div = div_amt / current_price
-            total_shares += shares_from_div
-        else:
-            cash_wallet += div_amt
-            
-        # 4. 計算總資產與均價
-        total_asset = (total_shares * current_price) + cash_wallet
-        
-        if total_shares > 0:
-            avg_cost = total_cost / total_shares
-        else:
-            avg_cost = 0
-            
-        # 5. 寫入數據 (新增參數欄位)
-        data.append({
-            "標的代號": metrics['symbol'],  # New
-            "歷史年化報酬率(%)": round(metrics['cagr'] * 100, 2), # New
-            "歷史平均殖利率(%)": round(metrics['yield'] * 100, 2), # New
-            "第N年": current_year_num,
-            "第N個月": m,
-            "總投入成本": round(total_cost, 0),
-            "累積持有股數": round(total_shares, 2),
-            "平均成本(均價)": round(avg_cost, 2),
-            "累積領取股息": round(total_divs, 0),
-            "預估股價": round(current_price, 2),
-            "總資產市值": round(total_asset, 0),
-            "損益金額": round(total_asset - total_cost, 0)
-        })
-        
-    return pd.DataFrame(data)
+    # 下載區塊 B
+    if df2 is not None:
+        csv2 = to_csv_bytes(df2[cols_order])
+        with col_dl2:
+            st.download_button(
+                label=f"下載 {ticker2} 完整報表",
+                data=csv2,
+                file_name=f"{ticker2}_report.csv",
+                mime='text/csv',
+            )
 
 # --- 主程式執行區 ---
 if btn_calc:
-    # 1. 分析選手 A
-    with st.spinner(f"正在分析 {ticker1}..."):
-        metrics1, err1 = get_historical_metrics(ticker1)
+    # 1. 分析選手 A (PK 模式時與選手 B 同時下載，兩檔的網路等待重疊進行)
+    metrics2, err2 = None, None
+    if enable_pk and ticker2:
+        with st.spinner(f"正在分析 {ticker1} 與 {ticker2}..."):
+            with ThreadPoolExecutor(max_workers=2, initializer=add_script_run_ctx,
+                                    initargs=(None, get_script_run_ctx())) as ex:
+                fut1 = ex.submit(get_historical_metrics, ticker1)
+                fut2 = ex.submit(get_historical_metrics, ticker2)
+                metrics1, err1 = fut1.result()
+                metrics2, err2 = fut2.result()
+    else:
+        with st.spinner(f"正在分析 {ticker1}..."):
+            metrics1, err1 = get_historical_metrics(ticker1)
     
     if err1:
         st.error(f"選手 A 錯誤: {err1}")
     else:
-        df1 = calculate_projection(metrics1, initial_lump_sum, monthly_invest, future_years, reinvest)
+        # 兩檔的股價路徑共用同一條時間軸，一次算完
+        if enable_pk and ticker2 and not err2:
+            paths = price_paths([metrics1, metrics2], future_years * 12)
+        else:
+            paths = price_paths([metrics1], future_years * 12)
+        
+        df1 = calculate_projection(metrics1, initial_lump_sum, monthly_invest, future_years, reinvest, price_path=paths[0])
         final1 = df1.iloc[-1]
         roi1 = (final1['損益金額'] / final1['總投入成本']) * 100
 
-        # 如果有開啟 PK 模式，分析選手 B
-        metrics2 = None
+        # 如果有開啟 PK 模式，推算選手 B
         df2 = None
         if enable_pk and ticker2:
-            with st.spinner(f"正在分析 {ticker2}..."):
-                metrics2, err2 = get_historical_metrics(ticker2)
             if err2:
                 st.error(f"選手 B 錯誤: {err2}")
             else:
-                df2 = calculate_projection(metrics2, initial_lump_sum, monthly_invest, future_years, reinvest)
+                df2 = calculate_projection(metrics2, initial_lump_sum, monthly_invest, future_years, reinvest, price_path=paths[1])
         
         # --- 顯示結果介面 ---
         
@@ -233,40 +171,23 @@ if btn_calc:
             chart_data[f"{ticker2} 總資產"] = df2['總資產市值']
         chart_data["投入成本"] = df1['總投入成本']
         
-        st.line_chart(chart_data, color=["#0000FF", "#FF0000", "#AAAAAA"] if metrics2 else ["#0000FF", "#AAAAAA"])
+        line_colors = ["#0000FF", "#FF0000", "#AAAAAA"] if metrics2 else ["#0000FF", "#AAAAAA"]
+        
+        # 直接組好 Altair 規格交給 Streamlit，省去 st.line_chart 每次重建編碼
+        melted = chart_data.reset_index().melt('index', var_name='series', value_name='value')
+        chart = alt.Chart(melted).mark_line().encode(
+            x=alt.X('index:Q', title=None),
+            y=alt.Y('value:Q', title=None),
+            color=alt.Color('series:N', title=None,
+                            scale=alt.Scale(domain=list(chart_data.columns), range=line_colors)),
+        )
+        st.altair_chart(chart, width="stretch")
         
         # D. 下載報表
         st.divider()
         st.subheader("📥 下載詳細報告 (含計算參數)")
         
-        # 調整欄位順序 (讓重點欄位排前面)
-        cols_order = [
-            "標的代號", "歷史年化報酬率(%)", "歷史平均殖利率(%)", 
-            "第N年", "第N個月", "總投入成本", "總資產市值", 
-            "損益金額", "累積持有股數", "平均成本(均價)", "累積領取股息"
-        ]
-        
-        # 下載區塊 A
-        csv1 = df1[cols_order].to_csv(index=False).encode('utf-8-sig')
-        col_dl1, col_dl2 = st.columns(2)
-        with col_dl1:
-            st.download_button(
-                label=f"下載 {ticker1} 完整報表",
-                data=csv1,
-                file_name=f"{ticker1}_report.csv",
-                mime='text/csv',
-            )
-        
-        # 下載區塊 B
-        if metrics2 and df2 is not None:
-            csv2 = df2[cols_order].to_csv(index=False).encode('utf-8-sig')
-            with col_dl2:
-                st.download_button(
-                    label=f"下載 {ticker2} 完整報表",
-                    data=csv2,
-                    file_name=f"{ticker2}_report.csv",
-                    mime='text/csv',
-                )
+        download_section(df1, df2, ticker1, ticker2)
 
 else:
     st.info("👈 請在左側輸入代號與金額，開始你的財富試算！")
@@ -0,0 +1,193 @@
+import streamlit as st
+import yfinance as yf
+import pandas as pd
+import numpy as np
+import math
+from numba import boolean, float64, from_dtype, njit, vectorize, void
+
+# --- 函數：下載原始歷史資料 (快取 1 小時，避免每次按鈕都重新連線 Yahoo) ---
+# 查無資料或連線失敗時直接拋出例外：st.cache_data 不會快取例外，下次按鈕會重新下載
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_history(ticker_symbol):
+    stock = yf.Ticker(ticker_symbol)
+    hist = stock.history(period="max", auto_adjust=False, actions=False)
+    if hist.empty:
+        raise ValueError(f"找不到 {ticker_symbol} 的資料")
+    # 只留下收盤價，其餘欄位 (開高低、成交量) 不需要快取與後續處理；
+    # 價格與股息以 float32 保存 (報表只顯示到小數第 2 位)，記憶體減半
+    hist = hist.filter(items=['Close']).astype(np.float32)
+    divs = stock.dividends.astype(np.float32)
+    return hist, divs
+
+# --- 函數：由歷史資料計算體質數據 (只快取成功的結果) ---
+@st.cache_data(ttl=3600, show_spinner=False)
+def _historical_metrics(ticker_symbol):
+    hist, divs = fetch_history(ticker_symbol)
+    
+    # 單一純量轉回 float64，讓年化報酬的次方運算維持精度
+    start_price = float(hist['Close'].iloc[0])
+    end_price = float(hist['Close'].iloc[-1])
+    
+    time_diff = (hist.index[-1] - hist.index[0]).days
+    years_past = time_diff / 365.25
+    
+    if years_past < 0.01: years_past = 0.01
+        
+    if start_price > 0:
+        price_cagr = math.pow(end_price / start_price, 1 / years_past) - 1
+    else:
+        price_cagr = 0
+        
+    if not divs.empty:
+        # 以整數年份分組，不需要建立完整的時間頻率網格；
+        # .year 取的是交易所當地日曆年，不必先把索引轉成無時區
+        yearly_divs = divs.groupby(divs.index.year).sum()
+        # 期間內沒有配息的年份視為 0 (與原本 resample 的口徑一致)
+        yearly_divs = yearly_divs.reindex(range(yearly_divs.index[0], yearly_divs.index[-1] + 1), fill_value=0.0)
+        yearly_prices = hist['Close'].groupby(hist.index.year).mean()
+        common = yearly_divs.index.intersection(yearly_prices.index)
+        if len(common) > 0:
+            # 直接在 ndarray 上相除取平均，略過 pandas 的索引對齊
+            avg_yield = np.nanmean(yearly_divs[common].to_numpy() / yearly_prices[common].to_numpy())
+        else:
+            avg_yield = divs.sum() / hist['Close'].mean() * (1/years_past)
+    else:
+        avg_yield = 0.0
+        
+    return {
+        "symbol": ticker_symbol,
+        "cagr": price_cagr,
+        "yield": float(avg_yield),
+        "current_price": end_price,
+        "years_data": years_past
+    }
+
+# --- 函數：抓取歷史數據 (錯誤在快取外轉成訊息，失敗不會被快取) ---
+def get_historical_metrics(ticker_symbol):
+    try:
+        return _historical_metrics(ticker_symbol), None
+    except Exception as e:
+        return None, str(e)
+
+# --- 函數：年化報酬換算月成長率 (numba ufunc，可直接套用在多檔標的的陣列上) ---
+@vectorize([float64(float64)], cache=True)
+def _monthly_growth(cagr):
+    return (1 + cagr) ** (1/12) - 1
+
+# --- 函數：第 m 個月的預估股價 (numba ufunc，依廣播規則展開成整張路徑表) ---
+@vectorize([float64(float64, float64, float64)], cache=True)
+def _price_at(start_price, monthly_growth, m):
+    return start_price * (1 + monthly_growth) ** m
+
+# --- 函數：股價路徑 (多檔標的共用同一條時間軸，一次廣播算出 (標的數, 月數) 矩陣) ---
+def price_paths(metrics_list, months):
+    time_axis = np.arange(1, months + 1, dtype=np.float64)
+    start_prices = np.array([m['current_price'] for m in metrics_list], dtype=np.float64)
+    monthly_growths = _monthly_growth(np.array([m['cagr'] for m in metrics_list], dtype=np.float64))
+    return _price_at(start_prices[:, None], monthly_growths[:, None], time_axis)
+
+# --- 逐月推算結果的結構化陣列格式 (每個月一筆紀錄) ---
+PROJECTION_DTYPE = np.dtype([
+    ('shares', np.float64),
+    ('avg_cost', np.float64),
+    ('divs', np.float64),
+    ('asset', np.float64),
+])
+
+# --- 函數：逐月推算核心 (numba 編譯，只含數值運算與陣列寫入) ---
+# 指定型別簽章，模組載入時就完成編譯 (cache=True 之後直接讀磁碟快取)，
+# 使用者第一次按下分析時不必等待 JIT
+@njit(void(float64[::1], float64, float64, float64, float64, boolean, from_dtype(PROJECTION_DTYPE)[::1]),
+      cache=True)
+def _project_core(prices, start_price, monthly_yield, monthly_amt, initial_fund, is_reinvest, out):
+    total_shares = 0.0
+    
+    # 處理第一筆單筆投入
+    if initial_fund > 0:
+        total_shares = initial_fund / start_price
+        
+    total_cost = initial_fund
+    cash_wallet = 0.0
+    total_divs = 0.0
+    
+    for i in range(out.shape[0]):
+        # 1. 股價成長 (已預先算好的路徑)
+        current_price = prices[i]
+        
+        # 2. 定期定額買入
+        if monthly_amt > 0:
+            total_shares += monthly_amt / current_price
+            total_cost += monthly_amt
+            
+        # 3. 處理配息
+        div_amt = total_shares * current_price * monthly_yield
+        total_divs += div_amt
+        
+        if is_reinvest:
+            total_shares += div_amt / current_price
+        else:
+            cash_wallet += div_amt
+            
+        # 4. 計算總資產與均價，寫入當月紀錄
+        row = out[i]
+        row.shares = total_shares
+        row.avg_cost = total_cost / total_shares if total_shares > 0 else 0.0
+        row.divs = total_divs
+        row.asset = (total_shares * current_price) + cash_wallet
+
+# --- 函數：推算未來資產 (新增：將參數寫入 DataFrame) ---
+def calculate_projection(metrics, initial_fund, monthly_amt, years, is_reinvest, price_path=None):
+    months = years * 12
+    monthly_yield = metrics['yield'] / 12
+    
+    # PK 模式由呼叫端傳入共用計算的股價路徑；單獨呼叫時自行計算
+    if price_path is None:
+        price_path = price_paths([metrics], months)[0]
+    price_path = np.ascontiguousarray(price_path, dtype=np.float64)
+    # 核心不做邊界檢查，路徑長度必須與推算月數一致
+    if price_path.shape != (months,):
+        raise ValueError(f"price_path 形狀 {price_path.shape} 與推算月數 {months} 不符")
+    
+    month_idx = np.arange(1, months + 1)
+    
+    # 計算目前是第幾年 (1~12月=1, 13~24月=2...)
+    year_num = (month_idx - 1) // 12 + 1
+    
+    # 總投入成本 (維持整數欄位)
+    if monthly_amt > 0:
+        total_cost = initial_fund + monthly_amt * month_idx
+    else:
+        total_cost = np.full(months, initial_fund)
+        
+    records = np.empty(months, dtype=PROJECTION_DTYPE)
+    _project_core(
+        price_path, float(metrics['current_price']), float(monthly_yield),
+        float(monthly_amt), float(initial_fund), bool(is_reinvest), records
+    )
+    total_shares = records['shares']
+    avg_cost = records['avg_cost']
+    total_divs = records['divs']
+    total_asset = records['asset']
+    current_price = price_path.round(2)
+    profit = total_asset - total_cost
+    
+    # 5. 四捨五入直接寫回已配置的欄位陣列，不另外產生暫存陣列
+    for col, digits in ((total_shares, 2), (avg_cost, 2), (total_divs, 0),
+                        (total_asset, 0), (profit, 0)):
+        np.round(col, digits, out=col)
+    
+    # 6. 以欄位陣列一次組成 DataFrame (含參數欄位)
+    return pd.DataFrame({
+        "標的代號": metrics['symbol'],
+        "歷史年化報酬率(%)": round(metrics['cagr'] * 100, 2),
+        "歷史平均殖利率(%)": round(metrics['yield'] * 100, 2),
+        "第N年": year_num,
+        "第N個月": month_idx,
+        "總投入成本": total_cost,
+        "累積持有股數": total_shares,
+        "平均成本(均價)": avg_cost,
+        "累積領取股息": total_divs,
+        "預估股價": current_price,
+        "總資產市值": total_asset,
+        "損益金額": profit
+    })